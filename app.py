@@ -1,6 +1,16 @@
+import atexit
 import os
-import psycopg2
-from flask import Flask, render_template, request, jsonify
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+
+import numpy as np
+import orjson
+import psycopg
+from psycopg_pool import ConnectionPool
+from pgvector.psycopg import register_vector
+from flask import Flask, Response, render_template, request, jsonify
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -8,45 +18,120 @@ load_dotenv()
 
 app = Flask(__name__)
 
-# Database connection configuration
-DB_CONFIG = {
+# Database connection configuration, snapshotted from the environment once at
+# import and frozen against accidental mutation
+DB_CONFIG = MappingProxyType({
     "dbname": os.getenv("DB_NAME", "postgres"),
     "user": os.getenv("DB_USER", "postgres"),
     "password": os.getenv("DB_PASSWORD", "postgres"),
     "host": os.getenv("DB_HOST", "localhost"),
     "port": os.getenv("DB_PORT", "5432"),
     "sslmode": os.getenv("DB_SSLMODE", "disable")
-}
+})
 
-def get_db_connection():
-    """Create and return a database connection."""
-    conn = psycopg2.connect(**DB_CONFIG)
+def _configure_connection(conn):
+    """One-time setup run by the pool for each new connection."""
     conn.autocommit = True
-    return conn
+    try:
+        # Registers pgvector's adapters: NumPy arrays can be sent as query
+        # parameters and results load as Vector/HalfVector wrappers over the
+        # binary protocol
+        register_vector(conn)
+    except Exception:
+        # database without pgvector; embeddings fall back to real[]
+        pass
+
+# Shared connection pool so handlers reuse backends instead of paying a
+# TCP handshake + backend fork on every request. Created lazily on first use
+# so that each gunicorn worker builds its own pool after fork — pooled
+# sockets are not fork-safe.
+CONN_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool():
+    """Return the per-process connection pool, creating it on first use."""
+    global CONN_POOL
+    if CONN_POOL is None:
+        with _POOL_LOCK:
+            if CONN_POOL is None:
+                CONN_POOL = ConnectionPool(
+                    kwargs=dict(DB_CONFIG), min_size=2, max_size=20,
+                    configure=_configure_connection)
+                atexit.register(CONN_POOL.close)
+    return CONN_POOL
+
+def get_db_connection():
+    """Check out a database connection from the pool."""
+    return get_pool().getconn()
+
+# Cached SQL type of embeddings.embedding ('vector', 'halfvec' or the real[]
+# fallback), looked up once per process so /search casts to the right type
+_EMBEDDING_SQL_TYPE = None
+
+def embedding_sql_type(cur):
+    """Return the SQL type name of the embeddings.embedding column."""
+    global _EMBEDDING_SQL_TYPE
+    if _EMBEDDING_SQL_TYPE is None:
+        cur.execute("""
+            SELECT format_type(atttypid, NULL)
+            FROM pg_attribute
+            WHERE attrelid = 'embeddings'::regclass AND attname = 'embedding';
+        """)
+        _EMBEDDING_SQL_TYPE = cur.fetchone()[0]
+    return _EMBEDDING_SQL_TYPE
+
+@contextmanager
+def db_cursor():
+    """Yield a cursor on a pooled connection, returning it to the pool when done."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+    finally:
+        get_pool().putconn(conn)
 
 @app.route('/')
 def index():
     """Display overview of database contents."""
+    # Keyset pagination: ?after_id= continues past the given id, ?limit= bounds
+    # each section. Keyset (id > x) is preferred over OFFSET, which still reads
+    # and discards every skipped row.
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Fetch users
-        cur.execute("SELECT id, email, tier FROM users ORDER BY id;")
-        users = cur.fetchall()
-        
-        # Fetch documents
-        cur.execute("SELECT id, user_id, title, upload_date FROM documents ORDER BY id;")
-        documents = cur.fetchall()
-        
-        # Fetch embeddings
-        cur.execute("SELECT id, doc_id, content, embedding FROM embeddings ORDER BY id;")
-        embeddings = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        
-        return render_template('index.html', users=users, documents=documents, embeddings=embeddings)
+        after_id = int(request.args.get('after_id', 0))
+        limit = min(int(request.args.get('limit', 50)), 200)
+    except ValueError:
+        return "<h1>Error</h1><p>after_id and limit must be integers.</p>", 400
+
+    try:
+        with db_cursor() as cur:
+            # One round-trip for all three sections: each subquery aggregates
+            # its paginated rows into a jsonb array. The raw embedding column
+            # is still left out — it was only rendered as debug noise.
+            cur.execute("""
+                SELECT
+                    (SELECT jsonb_agg(u) FROM (
+                        SELECT id, email, tier
+                        FROM users WHERE id > %(after)s ORDER BY id LIMIT %(limit)s) u),
+                    (SELECT jsonb_agg(d) FROM (
+                        SELECT id, user_id, title, upload_date
+                        FROM documents WHERE id > %(after)s ORDER BY id LIMIT %(limit)s) d),
+                    (SELECT jsonb_agg(e) FROM (
+                        SELECT id, doc_id, content
+                        FROM embeddings WHERE id > %(after)s ORDER BY id LIMIT %(limit)s) e),
+                    (SELECT COUNT(*) FROM embeddings);
+            """, {"after": after_id, "limit": limit})
+            users, documents, embeddings, embedding_count = cur.fetchone()
+
+        return render_template(
+            'index.html',
+            users=users or [],
+            documents=documents or [],
+            embeddings=embeddings or [],
+            embedding_count=embedding_count,
+        )
     except Exception as e:
         return f"<h1>Error</h1><p>{str(e)}</p>", 500
 
@@ -64,61 +149,119 @@ def search():
             if not query_input:
                 error = "Please enter a query vector."
             else:
-                # Parse space or comma-separated values
-                query_vector = [float(x.strip()) for x in query_input.replace(',', ' ').split()]
-                
-                if len(query_vector) != 3:
+                # Parse space or comma-separated values in one NumPy call
+                # instead of per-element Python float(). The original tokens
+                # are what gets echoed back into the form — a float32
+                # round-trip would render 0.1 as 0.10000000149...
+                tokens = query_input.replace(',', ' ').split()
+                vec = np.array(tokens, dtype=np.float32)
+                query_vector = tokens
+
+                if vec.size != 3:
                     error = "Query vector must have exactly 3 dimensions."
+                elif not np.linalg.norm(vec):
+                    error = "Query vector must be non-zero."
                 else:
-                    conn = get_db_connection()
-                    cur = conn.cursor()
-                    
-                    # Perform semantic search using pgvector operator (<=>)
-                    # Cast the query vector to vector type for pgvector compatibility
-                    query = """
-                        SELECT id, doc_id, content, embedding, 1 - (embedding <=> %s::vector) AS similarity
-                        FROM embeddings
-                        ORDER BY similarity DESC
-                        LIMIT 10;
-                    """
-                    cur.execute(query, (query_vector,))
-                    results = cur.fetchall()
-                    
-                    cur.close()
-                    conn.close()
+                    # Stored embeddings are unit-normalized, so the query must
+                    # be too for inner product to equal cosine similarity
+                    unit_vector = vec / np.linalg.norm(vec)
+                    with db_cursor() as cur:
+                        # Pin the HNSW candidate-list size so approximate search
+                        # recall is predictable at LIMIT 10 (harmless if no index)
+                        cur.execute("SET hnsw.ef_search = 40;")
+
+                        # Perform semantic search using pgvector's inner product
+                        # operator (<#>, cheaper than <=> on unit vectors) as a
+                        # server-side prepared statement (prepare=True); ordering
+                        # on the raw distance expression (not the derived
+                        # similarity alias) is what lets the planner use the HNSW
+                        # index. <#> returns the negated inner product, so ASC
+                        # puts the most similar rows first.
+                        cast = embedding_sql_type(cur)
+                        # The embedding column itself is not returned — it was
+                        # never displayed, and /doc/<id> serves it on demand
+                        cur.execute(f"""
+                            SELECT id, doc_id, content, -(embedding <#> %s::{cast}) AS similarity
+                            FROM embeddings
+                            ORDER BY embedding <#> %s::{cast} ASC
+                            LIMIT 10;
+                        """, (unit_vector, unit_vector), prepare=True)
+                        results = cur.fetchall()
         except ValueError as ve:
             error = f"Invalid vector format: {str(ve)}"
         except Exception as e:
             error = f"Database error: {str(e)}"
-    
+
     return render_template('search.html', results=results, query_vector=query_vector, error=error)
 
+@app.route('/doc/<int:row_id>')
+def doc_detail(row_id):
+    """Return one embeddings row, including its vector, as JSON.
+
+    The overview page no longer ships the raw vectors; this pulls a single row
+    by primary key for anyone who actually needs one. With the pgvector
+    adapter registered the value arrives as a Vector/HalfVector wrapper
+    rather than text.
+    """
+    try:
+        with db_cursor() as cur:
+            cur.execute(
+                "SELECT id, doc_id, content, embedding FROM embeddings WHERE id = %s;",
+                (row_id,))
+            row = cur.fetchone()
+        if row is None:
+            return jsonify({"error": "embedding not found"}), 404
+        embedding = row[3]
+        if hasattr(embedding, "to_list"):
+            # unwrap pgvector's Vector/HalfVector into a plain float list;
+            # the real[] fallback already arrives as one
+            embedding = embedding.to_list()
+        return Response(orjson.dumps({
+            "id": row[0],
+            "doc_id": row[1],
+            "content": row[2],
+            "embedding": embedding,
+        }), mimetype='application/json')
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Counts don't change every millisecond; serve repeated polls within the TTL
+# from memory and let browser/CDN caches absorb bursts via Cache-Control
+STATS_CACHE_TTL = 5  # seconds
+_stats_cache = {"expires": 0.0, "body": None}
+
 @app.route('/api/stats')
 def stats():
     """Return database stats as JSON."""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT COUNT(*) FROM users;")
-        user_count = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM documents;")
-        doc_count = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM embeddings;")
-        embed_count = cur.fetchone()[0]
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            "users": user_count,
-            "documents": doc_count,
-            "embeddings": embed_count
-        })
+        body = _stats_cache["body"]
+        if body is None or time.monotonic() >= _stats_cache["expires"]:
+            with db_cursor() as cur:
+                # One round-trip for all three counts instead of three separate queries
+                cur.execute("""
+                    SELECT (SELECT COUNT(*) FROM users),
+                           (SELECT COUNT(*) FROM documents),
+                           (SELECT COUNT(*) FROM embeddings);
+                """)
+                user_count, doc_count, embed_count = cur.fetchone()
+
+            # orjson serializes several times faster than Flask's default json
+            # module — this endpoint is the likely polling target
+            body = orjson.dumps({
+                "users": user_count,
+                "documents": doc_count,
+                "embeddings": embed_count
+            })
+            _stats_cache["body"] = body
+            _stats_cache["expires"] = time.monotonic() + STATS_CACHE_TTL
+
+        response = Response(body, mimetype='application/json')
+        response.headers['Cache-Control'] = f'public, max-age={STATS_CACHE_TTL}'
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Local development only. In production run under gunicorn, e.g.:
+    #   gunicorn -k gthread --threads 8 --workers $(nproc) --worker-tmp-dir /dev/shm app:app
+    app.run(host='0.0.0.0', port=5000)
@@ -1,15 +1,17 @@
-import psycopg2
-from psycopg2 import sql
+import psycopg
 import csv
+import math
 import os
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Database connection configuration
-# For demos we default to a local Postgres instance and read values from env vars
-DB_CONFIG = {
+# For demos we default to a local Postgres instance and read values from env
+# vars, snapshotted once at import and frozen against accidental mutation
+DB_CONFIG = MappingProxyType({
     "dbname": os.getenv("DB_NAME", "postgres"),
     "user": os.getenv("DB_USER", "postgres"),
     "password": os.getenv("DB_PASSWORD", "postgres"),
@@ -17,25 +19,50 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432"),
     # disable SSL for local demo; set to 'require' when connecting to Supabase
     "sslmode": os.getenv("DB_SSLMODE", "disable")
-}
+})
 
-def setup_schema(cur):
-    """Enables extensions and creates the necessary database schema."""
-    # Attempt to enable pgvector if available (harmless if not installed)
-    pgvector_available = False
+def enable_pgvector(cur):
+    """Attempts to enable the pgvector extension.
+
+    Must run on an autocommit connection: a failed CREATE EXTENSION inside the
+    main seeding transaction would abort every statement after it.
+
+    Returns True if the pgvector extension is available, False otherwise.
+    """
     try:
         cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-        pgvector_available = True
         print("pgvector extension enabled (if available)")
+        return True
     except Exception:
         # ignore if extension can't be created in local/demo environment
         print("pgvector extension not available; using array type for embeddings")
+        return False
 
-    print("Creating tables if they don't exist...")
+def setup_schema(cur, pgvector_available):
+    """Creates the necessary database schema."""
+    # halfvec (FP16) halves storage and memory traffic per distance comparison;
+    # supported from pgvector 0.7 onwards
+    halfvec_available = False
     if pgvector_available:
+        try:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+            version = cur.fetchone()[0]
+            halfvec_available = tuple(int(p) for p in version.split('.')[:2]) >= (0, 7)
+        except Exception:
+            pass
+
+    # Embeddings are stored unit-normalized, so the cheaper inner product
+    # operator (<#>) gives the same ranking as cosine distance
+    print("Creating tables if they don't exist...")
+    if halfvec_available:
+        embedding_type = 'halfvec(3)'
+        index_opclass = 'halfvec_ip_ops'
+    elif pgvector_available:
         embedding_type = 'vector(3)'
+        index_opclass = 'vector_ip_ops'
     else:
         embedding_type = 'real[]'
+        index_opclass = None
 
     cur.execute(f"""
         CREATE TABLE IF NOT EXISTS users (
@@ -60,46 +87,95 @@ def setup_schema(cur):
         );
     """)
 
-def seed_from_csv(cur, file_path, doc_id):
+    # B-tree indexes on the foreign keys: ON DELETE CASCADE and any filtered
+    # query (e.g. WHERE doc_id = x) would otherwise seq-scan the child table
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS documents_user_id_idx ON documents (user_id);
+        CREATE INDEX IF NOT EXISTS embeddings_doc_id_idx ON embeddings (doc_id);
+    """)
+
+    if pgvector_available:
+        # HNSW approximate nearest neighbor index so /search does a
+        # log-graph traversal instead of a sequential scan as the table grows.
+        # The savepoint keeps a failed CREATE INDEX from aborting the rest of
+        # the seeding transaction.
+        cur.execute("SAVEPOINT hnsw_index;")
+        try:
+            # one-shot seed session: give the HNSW build room to work in memory
+            cur.execute("SET maintenance_work_mem = '1GB';")
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS embeddings_embedding_hnsw
+                ON embeddings USING hnsw (embedding {index_opclass})
+                WITH (m = 16, ef_construction = 64);
+            """)
+            print("HNSW index created on embeddings.embedding")
+        except Exception:
+            # older pgvector builds (< 0.5) don't support HNSW; fall back to no index
+            cur.execute("ROLLBACK TO SAVEPOINT hnsw_index;")
+            print("HNSW index not supported by this pgvector version; skipping")
+
+def _normalize(vector):
+    """Scales a vector to unit length so inner product equals cosine similarity."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+def _copy_escape(value):
+    """Escapes a text value for COPY ... FROM STDIN (FORMAT text)."""
+    return (value.replace('\\', '\\\\')
+                 .replace('\t', '\\t')
+                 .replace('\n', '\\n')
+                 .replace('\r', '\\r'))
+
+def seed_from_csv(cur, file_path, doc_id, pgvector_available=True):
     """
-    Reads a CSV file and inserts the content into the embeddings table.
+    Streams a CSV file into the embeddings table via COPY ... FROM STDIN.
     Expected CSV format: content, v1, v2, v3
     """
     if not os.path.exists(file_path):
         print(f"Warning: CSV file not found at {file_path}. Skipping CSV seed.")
         return
 
-    print(f"Reading data from {file_path}...")
-    with open(file_path, mode='r', encoding='utf-8') as f:
-        reader = csv.reader(f)
+    # pgvector's text input format is [x,y,z]; the real[] fallback uses {x,y,z}
+    opener, closer = ('[', ']') if pgvector_available else ('{', '}')
+
+    def copy_lines(reader):
         # Skip header if it exists (uncomment if your CSV has a header row)
-        # next(reader) 
-        
-        rows_to_insert = []
+        # next(reader)
         for row in reader:
             if len(row) < 4:
                 continue
-            content = row[0]
-            # Convert the numeric strings to a float list for pgvector
-            vector = [float(row[1]), float(row[2]), float(row[3])]
-            rows_to_insert.append((doc_id, content, vector))
-        
-        if rows_to_insert:
-            cur.executemany(
-                "INSERT INTO embeddings (doc_id, content, embedding) VALUES (%s, %s, %s)", 
-                rows_to_insert
-            )
-            print(f"Successfully imported {len(rows_to_insert)} rows from CSV.")
+            content = _copy_escape(row[0])
+            v1, v2, v3 = _normalize([float(row[1]), float(row[2]), float(row[3])])
+            yield f"{doc_id}\t{content}\t{opener}{v1},{v2},{v3}{closer}\n"
+
+    print(f"Reading data from {file_path}...")
+    with open(file_path, mode='r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        with cur.copy("COPY embeddings (doc_id, content, embedding) FROM STDIN WITH (FORMAT text)") as copy:
+            for line in copy_lines(reader):
+                copy.write(line)
+    print(f"Successfully imported {cur.rowcount} rows from CSV.")
 
 def seed_database():
     conn = None
     try:
         print("Connecting to the PostgreSQL database...")
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = psycopg.connect(**DB_CONFIG)
         cur = conn.cursor()
 
+        # 0. Enable pgvector on its own autocommit statement, outside the
+        # seeding transaction
+        conn.autocommit = True
+        pgvector_available = enable_pgvector(cur)
+        conn.autocommit = False
+
+        # Everything below runs in one transaction committed at the end.
+        # Async commit skips the WAL fsync wait per statement — safe here,
+        # since a crashed seed run can simply be re-run.
+        cur.execute("SET LOCAL synchronous_commit = off;")
+
         # 1. Setup Tables
-        setup_schema(cur)
+        setup_schema(cur, pgvector_available)
 
         # 2. Clear existing data
         print("Cleaning up existing data...")
@@ -111,6 +187,8 @@ def seed_database():
             (5, 'alice@example.com', 'pro'),
             (42, 'bob@hk-tech.edu', 'free')
         ]
+        # psycopg 3's executemany batches the statements in pipeline mode —
+        # one round-trip per batch, not per row
         cur.executemany("INSERT INTO users (id, email, tier) VALUES (%s, %s, %s)", users)
 
         # 4. Insert Sample Documents
@@ -125,21 +203,29 @@ def seed_database():
         # 5. Insert Manual Mock Embeddings
         print("Inserting manual mock embeddings...")
         manual_embeddings = [
-            (1, 'Global temperatures rose by 1.5 degrees...', [0.1, 0.9, 0.2]),
-            (2, 'The alignment problem in LLMs refers to...', [0.7, 0.1, 0.8])
+            (doc_id, content, _normalize(vector))
+            for doc_id, content, vector in [
+                (1, 'Global temperatures rose by 1.5 degrees...', [0.1, 0.9, 0.2]),
+                (2, 'The alignment problem in LLMs refers to...', [0.7, 0.1, 0.8])
+            ]
         ]
         cur.executemany("INSERT INTO embeddings (doc_id, content, embedding) VALUES (%s, %s, %s)", manual_embeddings)
 
         # 6. Insert from CSV (Optional Laboratory Step)
         # Assuming you have a file named 'data.csv' in the same folder
-        seed_from_csv(cur, 'climate_report.csv', doc_id=1)
-        seed_from_csv(cur, 'ai_ethics.csv', doc_id=2)
-        seed_from_csv(cur, 'deepseek_architecture.csv', doc_id=3)
+        seed_from_csv(cur, 'climate_report.csv', doc_id=1, pgvector_available=pgvector_available)
+        seed_from_csv(cur, 'ai_ethics.csv', doc_id=2, pgvector_available=pgvector_available)
+        seed_from_csv(cur, 'deepseek_architecture.csv', doc_id=3, pgvector_available=pgvector_available)
+
+        # 7. Refresh planner statistics so the first queries after seeding
+        # cost the HNSW index correctly instead of guessing
+        print("Analyzing tables...")
+        cur.execute("ANALYZE users, documents, embeddings;")
 
         conn.commit()
         print("Successfully seeded the database!")
 
-    except (Exception, psycopg2.DatabaseError) as error:
+    except (Exception, psycopg.DatabaseError) as error:
         print(f"Error: {error}")
     finally:
         if conn is not None:
@@ -148,5 +234,5 @@ def seed_database():
             print("Database connection closed.")
 
 if __name__ == "__main__":
-    # Ensure you have psycopg2 installed: pip install psycopg2-binary
+    # Ensure you have psycopg installed: pip install "psycopg[binary]"
     seed_database()
\ No newline at end of file